@@ -0,0 +1,103 @@
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+MAX_CONCURRENT_TURNS = int(os.getenv('MAX_CONCURRENT_TURNS', 8))
+# DM turns allowed to wait for a free slot; beyond this requests are rejected immediately.
+MAX_QUEUED_TURNS = int(os.getenv('MAX_QUEUED_TURNS', 16))
+TURN_QUEUE_TIMEOUT_SECONDS = float(os.getenv('TURN_QUEUE_TIMEOUT_SECONDS', 30))
+MAX_LIVE_GAMES = int(os.getenv('MAX_LIVE_GAMES', 100))
+MAX_CREATING_GAMES = int(os.getenv('MAX_CREATING_GAMES', 2))
+RETRY_AFTER_SECONDS = int(os.getenv('RETRY_AFTER_SECONDS', 10))
+
+
+class AdmissionError(HTTPException):
+    """
+    Raised when a request is refused because the server is at capacity. Rendered by
+    FastAPI as a 429/503 response, with a Retry-After header unless retry_after is None.
+    """
+    def __init__(self, status_code: int, detail: str, retry_after: int = RETRY_AFTER_SECONDS):
+        headers = {'Retry-After': str(retry_after)} if retry_after is not None else None
+        super().__init__(status_code=status_code, detail=detail, headers=headers)
+
+
+class AdmissionController:
+    """
+    Bounds the number of concurrent DM turns (with a bounded wait queue) and the
+    number of live and in-creation games on this node.
+    """
+    def __init__(self, max_turns: int = MAX_CONCURRENT_TURNS, max_queued_turns: int = MAX_QUEUED_TURNS,
+                 queue_timeout_seconds: float = TURN_QUEUE_TIMEOUT_SECONDS, max_live_games: int = MAX_LIVE_GAMES,
+                 max_creating_games: int = MAX_CREATING_GAMES):
+        self.max_queued_turns = max_queued_turns
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self.max_live_games = max_live_games
+        self.max_creating_games = max_creating_games
+        self._turns = threading.BoundedSemaphore(max_turns)
+        self._queued_turns = 0
+        self._creating_games = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def turn(self):
+        """
+        Hold a DM turn slot, waiting in the bounded queue if all slots are busy.
+        """
+        if not self._turns.acquire(blocking=False):
+            with self._lock:
+                if self._queued_turns >= self.max_queued_turns:
+                    logger.warning("DM turn queue is full, rejecting turn")
+                    raise AdmissionError(429, "Too many pending DM turns, please retry later")
+                self._queued_turns += 1
+            try:
+                acquired = self._turns.acquire(timeout=self.queue_timeout_seconds)
+            finally:
+                with self._lock:
+                    self._queued_turns -= 1
+            if not acquired:
+                logger.warning("Timed out waiting for a DM turn slot")
+                raise AdmissionError(503, "The Dungeon Master is busy, please retry later")
+        try:
+            yield
+        finally:
+            self._turns.release()
+
+    def check_live_games(self, live_games: int, retryable: bool = True) -> None:
+        """
+        Refuse another live game at the limit. Pass retryable=False when no game can ever be
+        unloaded to make room, so clients aren't told to retry.
+        """
+        with self._lock:
+            self._check_live_games(live_games, retryable)
+
+    def _check_live_games(self, live_games: int, retryable: bool) -> None:
+        if live_games + self._creating_games >= self.max_live_games:
+            logger.warning(f"Live game limit reached: {live_games}")
+            if retryable:
+                raise AdmissionError(503, "Game limit reached, please retry later")
+            raise AdmissionError(503, "Game limit reached on this server", retry_after=None)
+
+    @contextmanager
+    def create_game(self, live_games: int, retryable: bool = True):
+        """
+        Admit the creation of a new game, which generates its opening scene with a DM turn.
+        """
+        with self._lock:
+            self._check_live_games(live_games, retryable)
+            if self._creating_games >= self.max_creating_games:
+                logger.warning("Too many games being created, rejecting new game")
+                raise AdmissionError(429, "Too many games being created, please retry later")
+            self._creating_games += 1
+        try:
+            with self.turn():
+                yield
+        finally:
+            with self._lock:
+                self._creating_games -= 1
+
+
+admission = AdmissionController()
@@ -0,0 +1,68 @@
+"""
+Micro-benchmark of per-game DM setup cost.
+
+Compares building the tool declarations by SDK introspection for every game (the
+previous behaviour) against the declarations precomputed in tools.py, and times
+DM_Agent construction with the shared client. Prompt caching is disabled so no
+network calls are made.
+
+Usage: python bench_startup.py [iterations]
+"""
+import os
+import sys
+import time
+
+os.environ['DM_PROMPT_CACHE'] = '0'
+os.environ.setdefault('API_KEY', 'benchmark')
+
+
+def timed(label, iterations, function):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    elapsed = (time.perf_counter() - start) / iterations
+    print(f"{label:<45} {elapsed * 1e6:10.1f} us/game")
+    return elapsed
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    start = time.perf_counter()
+    from google import genai
+    from google.genai import types
+    print(f"{'google.genai import (once per process)':<45} {(time.perf_counter() - start) * 1e3:10.1f} ms")
+
+    from game_state import GameState
+    from tools import DM_TOOL_NAMES, TOOL_DECLARATIONS
+    from dm_agent import DM_Agent
+
+    def introspect_tools():
+        game_state = GameState()
+        declarations = [types.FunctionDeclaration.from_callable_with_api_option(callable=getattr(game_state, name))
+                        for name in DM_TOOL_NAMES]
+        return [types.Tool(function_declarations=declarations)]
+
+    def precomputed_tools():
+        return TOOL_DECLARATIONS
+
+    def new_client_and_chat():
+        client = genai.Client(api_key=os.environ['API_KEY'])
+        return client.chats.create(model="gemini-2.5-flash-preview-04-17",
+                                   config=types.GenerateContentConfig(tools=introspect_tools()))
+
+    def new_dm_agent():
+        return DM_Agent(os.environ['API_KEY'], GameState())
+
+    before = timed("tool declarations via SDK introspection", iterations, introspect_tools)
+    after = timed("precomputed tool declarations", iterations, precomputed_tools)
+    print(f"{'  speedup':<45} {before / after:10.0f} x")
+    before = timed("new client + introspected chat (previous)", iterations, new_client_and_chat)
+    after = timed("DM_Agent construction (shared client)", iterations, new_dm_agent)
+    print(f"{'  speedup':<45} {before / after:10.1f} x")
+
+
+if __name__ == '__main__':
+    import logging
+    logging.disable(logging.INFO)
+    main()
@@ -58,4 +58,5 @@ class Location():
         self.npcs = [Npc('').from_dict(npc_data) for npc_data in data['npcs']]
         self.neighbours = data['neighbours']
         self.visited = data['visited']
+        return self # Return self to allow method chaining if needed
     
\ No newline at end of file
@@ -1,38 +1,149 @@
 import logging
-from google import genai
+import threading
+import time
 from utils import format_prompt, DM_INITIAL_PROMPT, GAME_START_PROMPT
 from game_state import GameState
+from prompt_cache import prompt_cache, PROMPT_CACHE_ENABLED
+from tools import TOOL_DECLARATIONS, dispatch_tool_call
+from structured import (STRUCTURED_OUTPUT, STRUCTURED_OUTPUT_PROMPT, StructuredResponseParser,
+                        apply_state_update, response_schema, scene_context)
+from model_router import classify_turn, model_router
 
 logger = logging.getLogger(__name__)
 
+# Model for the opening scene; later turns are routed per turn class by model_router.
+DM_MODEL = model_router.model_for('scene_generation')
+
+# Upper bound on model <-> tool round trips for a single DM turn.
+MAX_TOOL_ROUNDS = 16
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_client(api_key):
+    """
+    Return a genai client shared by every game using this API key. The SDK is
+    imported on first use so it stays off the server's import path.
+    """
+    with _clients_lock:
+        if api_key not in _clients:
+            from google import genai
+            _clients[api_key] = genai.Client(api_key=api_key)
+        return _clients[api_key]
+
 class DM_Agent:
-    def __init__(self, api_key, game_state: GameState):
+    def __init__(self, api_key, game_state: GameState, history: list = None, structured: bool = STRUCTURED_OUTPUT):
         try:
             logger.info("Initializing DM_Agent")
-            self.client = genai.Client(api_key=api_key)
+            from google.genai import types
+            self.client = get_client(api_key)
             self.game_state = game_state
-            
-            config = {
-                "tools": [game_state.add_player, game_state.add_location, game_state.add_npc,
-                         game_state.update_player_state, game_state.update_npc_state, game_state.update_location_state,
-                         game_state.get_player_state, game_state.get_location_state, game_state.get_npc_state,
-                         game_state.get_all_players, game_state.get_all_npcs, game_state.get_all_locations, game_state.get_history],
-            }
-
-            self.chat = self.client.chats.create(model="gemini-2.5-flash-preview-04-17", config=config)
+            self.cached_content = None
+            self.model = DM_MODEL
+            # In structured mode the model returns narrative plus state updates as JSON instead of calling tools.
+            self.structured = structured
+            self.system_instruction = DM_INITIAL_PROMPT + STRUCTURED_OUTPUT_PROMPT if structured else DM_INITIAL_PROMPT
+            self.tools = None if structured else TOOL_DECLARATIONS
+            if history:
+                history = [types.Content.model_validate_json(content) for content in history]
+            self.chat = self._create_chat(history=history)
             logger.info("Successfully initialized DM_Agent")
         except Exception as e:
             logger.error(f"Error initializing DM_Agent: {str(e)}", exc_info=True)
             raise
-    
-    def start_game(self):
-        response = self.chat.send_message(DM_INITIAL_PROMPT)
 
+    def _create_chat(self, history=None, model=None):
+        from google.genai import types
+        model = model or self.model
+        cached_content = None
+        if PROMPT_CACHE_ENABLED:
+            cached_content = prompt_cache.get_cached_content(self.client, model, self.system_instruction, self.tools)
+        # Tool calls are dispatched by _send_message against the current game state,
+        # so automatic function calling is disabled in both modes.
+        config = {'automatic_function_calling': types.AutomaticFunctionCallingConfig(disable=True)}
+        if cached_content:
+            config['cached_content'] = cached_content
+        else:
+            config['system_instruction'] = self.system_instruction
+            config['tools'] = self.tools
+        if self.structured:
+            config['response_mime_type'] = 'application/json'
+            config['response_schema'] = response_schema()
+        config = types.GenerateContentConfig(**config)
+        self.cached_content = cached_content
+        self.model = model
+        return self.client.chats.create(model=model, config=config, history=history or [])
+
+    def _refresh_chat(self):
+        """
+        Recreate the chat, keeping its history, if the shared prompt cache was replaced.
+        """
+        if not self.cached_content:
+            return
+        cached_content = prompt_cache.get_cached_content(self.client, self.model, self.system_instruction, self.tools)
+        if cached_content != self.cached_content:
+            logger.info("Prompt cache changed, recreating DM chat")
+            self.chat = self._create_chat(history=self.chat.get_history())
+
+    def _route(self, turn_class: str) -> str:
+        """
+        Switch the chat to the model for this turn class, carrying its history over, and return the tier.
+        """
+        tier = model_router.tier_for(turn_class)
+        model = model_router.model_for(turn_class)
+        if model != self.model:
+            logger.info(f"Routing {turn_class} turn to {tier} model {model}")
+            self.chat = self._create_chat(history=self.chat.get_history(), model=model)
+        else:
+            self._refresh_chat()
+        return tier
+
+    def _send_message(self, message, turn_class: str = None) -> str:
+        """
+        Run one DM turn on the model routed for its turn class and return its narrative text.
+        """
+        turn_class = turn_class or classify_turn(message)
+        tier = self._route(turn_class)
+        started = time.perf_counter()
+        try:
+            if self.structured:
+                return self._send_structured_message(message)
+            return self._send_tool_message(message)
+        finally:
+            model_router.record(tier, turn_class, time.perf_counter() - started)
+
+    def _send_tool_message(self, message) -> str:
+        from google.genai import types
+        response = self.chat.send_message(message)
+        rounds = 0
+        while response.function_calls and rounds < MAX_TOOL_ROUNDS:
+            parts = [types.Part.from_function_response(name=call.name,
+                                                       response=dispatch_tool_call(self.game_state, call.name, call.args))
+                     for call in response.function_calls]
+            response = self.chat.send_message(parts)
+            rounds += 1
+        if response.function_calls:
+            logger.warning(f"Stopped tool dispatch after {MAX_TOOL_ROUNDS} rounds")
+        # text is None when the model stopped on function calls or returned nothing.
+        return response.text or ''
+
+    def _send_structured_message(self, message) -> str:
+        """
+        Stream a structured response, applying each state update as soon as it is complete.
+        """
+        parser = StructuredResponseParser()
+        prompt = f"Current scene state: {scene_context(self.game_state)}\n\n{message}"
+        for chunk in self.chat.send_message_stream(prompt):
+            for update in parser.feed(chunk.text or ''):
+                apply_state_update(self.game_state, update)
+        return parser.result()['narrative']
+
+    def start_game(self):
         print("\nDUNGEONS & DRAGONS")
 
-        response = self.chat.send_message(GAME_START_PROMPT)
-        print(response.text)
-        self.game_state.add_history(response.text)
+        response = self._send_message(GAME_START_PROMPT, turn_class='scene_generation')
+        print(response)
+        self.game_state.add_history(response)
 
     def set_game_state(self, game_state):
         try:
@@ -43,23 +154,36 @@ class DM_Agent:
             logger.error(f"Error setting game state: {str(e)}", exc_info=True)
             raise
 
+    def get_chat_history(self, start: int = 0) -> list:
+        """
+        Return the DM chat history from index start as JSON strings, suitable for snapshots.
+        """
+        try:
+            logger.info("Retrieving DM chat history")
+            history = [content.model_dump_json(exclude_none=True) for content in self.chat.get_history()[start:]]
+            logger.info("Successfully retrieved DM chat history")
+            return history
+        except Exception as e:
+            logger.error(f"Error retrieving DM chat history: {str(e)}", exc_info=True)
+            raise
+
     def get_dm_response(self, player_action):
         try:
             logger.info(f"Getting DM response for player action: {player_action}")
             prompt = format_prompt(player_action)
-            response = self.chat.send_message(prompt)
+            response = self._send_message(prompt)
             logger.info("Successfully received DM response")
-            return response.text
+            return response
         except Exception as e:
             logger.error(f"Error getting DM response: {str(e)}", exc_info=True)
             raise
-    
-    def dm_message(self, message):
+
+    def dm_message(self, message, turn_class: str = None):
         try:
             logger.info(f"Sending DM message: {message}")
-            response = self.chat.send_message(message)
+            response = self._send_message(message, turn_class=turn_class)
             logger.info("Successfully sent DM message")
-            return response.text
+            return response
         except Exception as e:
             logger.error(f"Error sending DM message: {str(e)}", exc_info=True)
             raise
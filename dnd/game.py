@@ -2,7 +2,14 @@ import logging
 from dm_agent import DM_Agent
 from player_agent import PlayerAgent
 from game_state import GameState
+from snapshot import encode_snapshot, decode_snapshot
+from oplog import open_oplog
+from responses import CachedPayload
+from round_batcher import RoundBatcher
+from admission import admission
 import os
+import threading
+import time
 
 logger = logging.getLogger(__name__)
 
@@ -10,21 +17,172 @@ API_KEY = os.getenv('API_KEY', '')
 if not API_KEY:
     logger.warning("API_KEY not found in environment variables")
 
+# GameState mutations that are replayed from the operation log on recovery.
+REPLAYED_OPS = {'add_player', 'add_npc', 'add_location', 'update_player_state',
+                'update_npc_state', 'update_location_state', 'add_history'}
+
+class GameUnloaded(Exception):
+    """
+    Raised when a turn is attempted on a game that was unloaded; recover it and retry.
+    """
+    pass
+
 class Game():
-    def __init__(self, name: str):
+    def __init__(self, name: str, snapshot: bytes = None, recover: bool = False):
+        """
+        Start a new game, restore one from a snapshot, or recover it from its operation log.
+        Restoring and recovering do not generate a new opening scene.
+        """
         try:
             logger.info(f"Initializing new game: {name}")
             self.name = name
             self.players = []
-            self.game_state = GameState()
-            self.dm = DM_Agent(API_KEY, game_state=self.game_state)
-            self.dm.start_game()
-            self.game_checksum = 0
+            self.payloads = {}
+            self.last_used = time.monotonic()
+            self.unloaded = False
+            # Serializes DM turns and state changes so snapshots match the operation log.
+            self.turn_lock = threading.RLock()
+            self.round_batcher = RoundBatcher(self)
+            self.oplog = open_oplog(name)
+            if recover:
+                snapshot, records = self.oplog.load()
+                self._restore(decode_snapshot(snapshot) if snapshot else None, records)
+            elif snapshot is not None:
+                self._restore(decode_snapshot(snapshot), [])
+                if self.oplog is not None:
+                    # The restored snapshot becomes the base of this game's log.
+                    self.oplog.reset()
+                    self.oplog.compact(snapshot)
+            else:
+                if self.oplog is not None:
+                    self.oplog.reset()
+                try:
+                    self.game_state = GameState()
+                    self.game_state.oplog = self.oplog
+                    self.dm = DM_Agent(API_KEY, game_state=self.game_state)
+                    self.game_checksum = 0
+                    self.logged_dm_history = 0
+                    self.dm.start_game()
+                    self.log_turn()
+                except Exception:
+                    if self.oplog is not None:
+                        # Don't leave a half-built game on disk for find_game to recover.
+                        self.oplog.reset()
+                    raise
             logger.info(f"Successfully initialized game: {name}")
         except Exception as e:
             logger.error(f"Error initializing game {name}: {str(e)}", exc_info=True)
             raise
 
+    def _restore(self, data: dict, records: list):
+        game_state = GameState.from_snapshot(data['game_state']) if data else GameState()
+        dm_history = list(data['dm_history']) if data else []
+        game_checksum = data['game_checksum'] if data else 0
+        logger.info(f"Replaying {len(records)} logged operations")
+        for record in records:
+            if record['op'] == 'turn':
+                dm_history.extend(record['args'][0])
+                game_checksum = record['args'][1]
+            elif record['op'] in REPLAYED_OPS:
+                getattr(game_state, record['op'])(*record['args'])
+            else:
+                logger.warning(f"Skipping unknown logged operation: {record['op']}")
+        # Attach the log only after replay so replayed operations are not logged twice.
+        game_state.oplog = self.oplog
+        self.game_state = game_state
+        self.dm = DM_Agent(API_KEY, game_state=self.game_state, history=dm_history)
+        self.game_checksum = game_checksum
+        self.logged_dm_history = len(dm_history)
+
+    @classmethod
+    def recover(cls, name: str):
+        """
+        Recover a game from its last snapshot and operation log, or return None if it was never persisted.
+        """
+        try:
+            oplog = open_oplog(name)
+            if oplog is None or not oplog.exists():
+                return None
+            logger.info(f"Recovering game: {name}")
+            game = cls(name, recover=True)
+            logger.info(f"Successfully recovered game: {name}")
+            return game
+        except Exception as e:
+            logger.error(f"Error recovering game {name}: {str(e)}", exc_info=True)
+            raise
+
+    def log_turn(self):
+        """
+        Log the DM chat turns and checksum since the last call, compacting the log when it grows large.
+        """
+        try:
+            if self.oplog is None:
+                return
+            with self.turn_lock:
+                dm_history = self.dm.get_chat_history(start=self.logged_dm_history)
+                self.oplog.append('turn', [dm_history, self.game_checksum])
+                # Group commit: the turn's state changes and chat delta are written and synced together.
+                self.oplog.flush()
+                self.logged_dm_history += len(dm_history)
+                if self.oplog.should_compact():
+                    seq = self.oplog.seq
+                    self.oplog.compact(self.snapshot(), seq)
+        except Exception as e:
+            logger.error(f"Error logging turn for game {self.name}: {str(e)}", exc_info=True)
+            raise
+
+    def unload(self) -> bool:
+        """
+        Close an idle game so it can be dropped from memory and recovered from its operation
+        log later. Returns False for games without a log and games with a turn or round in progress.
+        """
+        if self.oplog is None or not self.turn_lock.acquire(blocking=False):
+            return False
+        try:
+            if self.round_batcher.is_open():
+                return False
+            logger.info(f"Unloading game: {self.name}")
+            self.unloaded = True
+            self.oplog.close()
+            return True
+        finally:
+            self.turn_lock.release()
+
+    def _check_loaded(self):
+        if self.unloaded:
+            raise GameUnloaded(f"Game {self.name} was unloaded")
+
+    def snapshot(self) -> bytes:
+        try:
+            logger.info(f"Creating snapshot of game: {self.name}")
+            with self.turn_lock:
+                data = {
+                    'game_state': self.game_state.to_snapshot(),
+                    'dm_history': self.dm.get_chat_history(),
+                    'game_checksum': self.game_checksum,
+                }
+            snapshot = encode_snapshot(data)
+            logger.info(f"Successfully created snapshot of game {self.name} ({len(snapshot)} bytes)")
+            return snapshot
+        except Exception as e:
+            logger.error(f"Error creating snapshot of game {self.name}: {str(e)}", exc_info=True)
+            raise
+
+    @classmethod
+    def fork(cls, name: str, snapshot: bytes) -> 'Game':
+        """
+        Start a new game from a snapshot. The snapshot is immutable, so any number of
+        games can be forked from it; each fork decodes its own copy of the state.
+        """
+        try:
+            logger.info(f"Forking game {name} from snapshot")
+            game = cls(name, snapshot=snapshot)
+            logger.info(f"Successfully forked game: {name}")
+            return game
+        except Exception as e:
+            logger.error(f"Error forking game {name}: {str(e)}", exc_info=True)
+            raise
+
     def update_game_checksum(self):
         try:
             logger.info("Updating game checksum")
@@ -44,6 +202,25 @@ class Game():
             logger.error(f"Error adding player {player}: {str(e)}", exc_info=True)
             raise
 
+    def get_payload(self, key, build):
+        """
+        Return the serialized response for key, rebuilding it only when the game state changed.
+        Payloads from older revisions are dropped, so only the current revision is kept.
+        """
+        try:
+            revision = (self.game_state.revision, self.game_checksum)
+            entry = self.payloads.get(key)
+            if entry is None or entry[0] != revision:
+                logger.info(f"Serializing payload: {key}")
+                entry = (revision, CachedPayload(build()))
+                self.payloads = {cached_key: cached for cached_key, cached in self.payloads.items()
+                                 if cached[0] == revision}
+                self.payloads[key] = entry
+            return entry[1]
+        except Exception as e:
+            logger.error(f"Error building payload {key}: {str(e)}", exc_info=True)
+            raise
+
     def get_game_history(self):
         try:
             logger.info("Retrieving game history")
@@ -54,6 +231,16 @@ class Game():
             logger.error(f"Error retrieving game history: {str(e)}", exc_info=True)
             raise
     
+    def search_game_history(self, query, k=5):
+        try:
+            logger.info(f"Searching game history for: {query}")
+            results = self.game_state.search_history(query, k)
+            logger.info("Successfully searched game history")
+            return results
+        except Exception as e:
+            logger.error(f"Error searching game history: {str(e)}", exc_info=True)
+            raise
+    
     def get_players_state(self):
         try:
             logger.info("Retrieving players state")
@@ -87,15 +274,32 @@ class Game():
     def update_game(self, player_action):
         try:
             logger.info(f"Updating game with player action: {player_action}")
-            dm_response = self.dm.get_dm_response(player_action)
-            self.game_state.add_history(dm_response)
-            self.update_game_checksum()
+            with self.turn_lock:
+                self._check_loaded()
+                with admission.turn():
+                    dm_response = self.dm.get_dm_response(player_action)
+                self.game_state.add_history(dm_response)
+                self.update_game_checksum()
+                self.log_turn()
             logger.info("Successfully updated game")
             return dm_response
         except Exception as e:
             logger.error(f"Error updating game: {str(e)}", exc_info=True)
             raise
 
+    def submit_round_action(self, player_name, player_action):
+        """
+        Add an action to the current round and wait for the round's shared DM response.
+        """
+        try:
+            logger.info(f"Submitting round action for player {player_name}: {player_action}")
+            dm_response = self.round_batcher.submit(player_name, player_action)
+            logger.info(f"Successfully resolved round action for player {player_name}")
+            return dm_response
+        except Exception as e:
+            logger.error(f"Error resolving round action for player {player_name}: {str(e)}", exc_info=True)
+            raise
+
     def print_game_state(self):
         try:
             logger.info("Printing game state")
@@ -128,10 +332,15 @@ class Game():
     def update_player(self, player_name, player_state):
         try:
             logger.info(f"Updating player {player_name} with new state")
-            self.game_state.update_player_state(player_name, player_state)
-            dm_response = self.dm.dm_message(f"Player {player_name} state updated.")
-            self.game_state.add_history(dm_response)
-            self.update_game_checksum()
+            with self.turn_lock:
+                self._check_loaded()
+                # Take the turn slot first so a refused turn leaves the state unchanged.
+                with admission.turn():
+                    self.game_state.update_player_state(player_name, player_state)
+                    dm_response = self.dm.dm_message(f"Player {player_name} state updated.", turn_class='state_update')
+                self.game_state.add_history(dm_response)
+                self.update_game_checksum()
+                self.log_turn()
             logger.info(f"Successfully updated player {player_name}")
             return dm_response
         except Exception as e:
@@ -3,6 +3,9 @@ from utils import DICE_PATTERN
 from data.player import Player
 from data.npc import Npc
 from data.location import Location
+from history_index import HistoryIndex
+from location_graph import LocationGraph
+from validation import PLAYER_VALIDATOR, NPC_VALIDATOR, LOCATION_VALIDATOR
 
 logger = logging.getLogger(__name__)
 
@@ -10,17 +13,41 @@ class GameState:
     def __init__(self, debug = False):
         self.players = {}
         self.locations = {}
+        self.location_graph = LocationGraph()
         self.npcs = {}
         self.history = []
+        self.history_index = HistoryIndex()
         self.current_location = None
         self.debug = debug
+        self.oplog = None
+        # Incremented on every mutation; lets callers cache anything derived from the state.
+        self.revision = 0
         logger.info("Initialized new GameState instance")
 
+    @staticmethod
+    def _update_result(errors: list):
+        """
+        Result of an update: True when applied cleanly, otherwise the fields that were
+        rejected so the caller can fix them without resending the whole state.
+        """
+        if not errors:
+            return True
+        return {'success': True, 'errors': errors}
+
+    def _record(self, op: str, *args) -> None:
+        """
+        Note a successful mutation and append it to the operation log, if the game is durable.
+        """
+        self.revision += 1
+        if self.oplog is not None:
+            self.oplog.append(op, list(args))
+
     def add_player(self, player_name: str) -> bool:
         try:
             logger.info(f"Attempting to add player: {player_name}")
             if player_name not in self.players:
                 self.players[player_name] = Player(player_name)
+                self._record('add_player', player_name)
                 logger.info(f"Successfully added player: {player_name}")
                 return True
             else:
@@ -45,17 +72,26 @@ class GameState:
             return None
 
     def update_player_state(self, player_name: str, new_state: dict) -> bool:
+        """
+        Update a player with the given fields. Returns True, or a dict listing fields that
+        were rejected (and left unchanged) when some of the data was invalid.
+        """
         try:
             logger.info(f"Updating state for player: {player_name}")
             if player_name in self.players:
+                new_state, errors = PLAYER_VALIDATOR.validate(new_state)
+                if new_state is None:
+                    logger.warning(f"Rejected state for player {player_name}: {errors}")
+                    return {'success': False, 'errors': errors}
                 current_state_dict = self.players[player_name].to_dict()
                 current_state_dict.update(new_state)
                 self.players[player_name].from_dict(current_state_dict)
+                self._record('update_player_state', player_name, new_state)
                 logger.info(f"Successfully updated state for player: {player_name}")
-                return True
+                return self._update_result(errors)
             else:
                 logger.warning(f"Player {player_name} not found in game state")
-                return False
+                return {'success': False, 'errors': [f"Player {player_name} not found; call add_player first"]}
         except Exception as e:
             logger.error(f"Error updating state for player {player_name}: {str(e)}", exc_info=True)
             return False
@@ -65,6 +101,8 @@ class GameState:
             logger.info(f"Attempting to add location: {location_name}")
             if location_name not in self.locations:
                 self.locations[location_name] = Location(location_name, description)
+                self.location_graph.set_neighbours(location_name, [])
+                self._record('add_location', location_name, description)
                 logger.info(f"Successfully added location: {location_name}")
                 return True
             else:
@@ -89,27 +127,78 @@ class GameState:
             return None
     
     def update_location_state(self, location_name: str, new_state: dict) -> bool:
+        """
+        Update a location with the given fields, creating it if it doesn't exist. Returns True,
+        or a dict listing fields that were rejected (and left unchanged) when some of the data was invalid.
+        """
         try:
             logger.info(f"Updating state for location: {location_name}")
+            new_state, errors = LOCATION_VALIDATOR.validate(new_state)
+            if new_state is None:
+                logger.warning(f"Rejected state for location {location_name}: {errors}")
+                return {'success': False, 'errors': errors}
             if location_name in self.locations:
                 current_state_dict = self.locations[location_name].to_dict()
                 current_state_dict.update(new_state)
                 self.locations[location_name].from_dict(current_state_dict)
+                self.location_graph.set_neighbours(location_name, self.locations[location_name].neighbours)
+                self._record('update_location_state', location_name, new_state)
                 logger.info(f"Successfully updated state for location: {location_name}")
-                return True
+                return self._update_result(errors)
             else:
-                self.locations[location_name] = Location(location_name).from_dict(new_state)
+                location = Location(location_name, new_state.get('description', ''))
+                current_state_dict = location.to_dict()
+                current_state_dict.update(new_state)
+                self.locations[location_name] = location.from_dict(current_state_dict)
+                self.location_graph.set_neighbours(location_name, self.locations[location_name].neighbours)
+                self._record('update_location_state', location_name, new_state)
                 logger.info(f"Created new location: {location_name}")
-                return True
+                return self._update_result(errors)
         except Exception as e:
             logger.error(f"Error updating state for location {location_name}: {str(e)}", exc_info=True)
             return False
         
+    def find_path(self, from_location: str, to_location: str) -> dict:
+        """
+        Find the shortest route between two locations through their neighbours.
+        Returns {"path": [locations...], "hops": n}, or {"path": None} if they are not connected.
+        """
+        try:
+            logger.info(f"Finding path from {from_location} to {to_location}")
+            path = self.location_graph.shortest_path(from_location, to_location)
+            if path is None:
+                logger.info(f"No path from {from_location} to {to_location}")
+                return {'path': None}
+            logger.info(f"Successfully found path from {from_location} to {to_location}")
+            return {'path': list(path), 'hops': len(path) - 1}
+        except Exception as e:
+            logger.error(f"Error finding path from {from_location} to {to_location}: {str(e)}", exc_info=True)
+            return {'path': None}
+
+    def get_nearby_locations(self, location_name: str, max_hops: int = 1) -> list:
+        """
+        List the locations reachable from a location in at most max_hops moves,
+        nearest first, as {"name", "hops", "visited"} dicts.
+        """
+        try:
+            logger.info(f"Retrieving locations within {max_hops} hops of {location_name}")
+            distances = self.location_graph.within_hops(location_name, int(max_hops))
+            nearby = [{'name': name,
+                       'hops': hops,
+                       'visited': self.locations[name].visited if name in self.locations else False}
+                      for name, hops in sorted(distances.items(), key=lambda item: (item[1], item[0]))]
+            logger.info(f"Successfully retrieved {len(nearby)} nearby locations for {location_name}")
+            return nearby
+        except Exception as e:
+            logger.error(f"Error retrieving nearby locations for {location_name}: {str(e)}", exc_info=True)
+            return []
+
     def add_npc(self, npc_name: str) -> bool:
         try:
             logger.info(f"Attempting to add NPC: {npc_name}")
             if npc_name not in self.npcs:
                 self.npcs[npc_name] = Npc(npc_name)
+                self._record('add_npc', npc_name)
                 logger.info(f"Successfully added NPC: {npc_name}")
                 return True
             else:
@@ -134,17 +223,26 @@ class GameState:
             return None
 
     def update_npc_state(self, npc_name: str, new_state: dict) -> bool:
+        """
+        Update an NPC with the given fields. Returns True, or a dict listing fields that
+        were rejected (and left unchanged) when some of the data was invalid.
+        """
         try:
             logger.info(f"Updating state for NPC: {npc_name}")
             if npc_name in self.npcs:
+                new_state, errors = NPC_VALIDATOR.validate(new_state)
+                if new_state is None:
+                    logger.warning(f"Rejected state for NPC {npc_name}: {errors}")
+                    return {'success': False, 'errors': errors}
                 current_state_dict = self.npcs[npc_name].to_dict()
                 current_state_dict.update(new_state)
                 self.npcs[npc_name].from_dict(current_state_dict)
+                self._record('update_npc_state', npc_name, new_state)
                 logger.info(f"Successfully updated state for NPC: {npc_name}")
-                return True
+                return self._update_result(errors)
             else:
                 logger.warning(f"NPC {npc_name} not found in game state")
-                return False
+                return {'success': False, 'errors': [f"NPC {npc_name} not found; call add_npc first"]}
         except Exception as e:
             logger.error(f"Error updating state for NPC {npc_name}: {str(e)}", exc_info=True)
             return False
@@ -153,10 +251,27 @@ class GameState:
         try:
             logger.info(f"Adding entry to game history: {log_entry}")
             self.history.append(log_entry)
+            self.history_index.add(log_entry)
+            self._record('add_history', log_entry)
             logger.info("Successfully added entry to game history")
         except Exception as e:
             logger.error(f"Error adding entry to game history: {str(e)}", exc_info=True)
 
+    def search_history(self, query: str, k: int = 5) -> list:
+        """
+        Search the game history for the k entries most relevant to the query.
+        Returns a list of {"index", "entry", "score"} dicts, best match first.
+        """
+        try:
+            logger.info(f"Searching game history for: {query}")
+            results = [{'index': doc_id, 'entry': self.history[doc_id], 'score': round(score, 3)}
+                       for doc_id, score in self.history_index.search(query, int(k))]
+            logger.info(f"Successfully found {len(results)} matching history entries")
+            return results
+        except Exception as e:
+            logger.error(f"Error searching game history for {query}: {str(e)}", exc_info=True)
+            return []
+
     def get_all_players(self) -> dict:
         try:
             logger.info("Retrieving all players")
@@ -203,6 +318,44 @@ class GameState:
             logger.error(f"Error retrieving game history: {str(e)}", exc_info=True)
             return []
 
+    def to_snapshot(self) -> dict:
+        try:
+            logger.info("Creating game state snapshot")
+            snapshot = {
+                'players': {name: player.to_dict() for name, player in self.players.items()},
+                'npcs': {name: npc.to_dict() for name, npc in self.npcs.items()},
+                'locations': {name: location.to_dict() for name, location in self.locations.items()},
+                'history': self.history.copy(),
+                'current_location': self.current_location,
+            }
+            logger.info("Successfully created game state snapshot")
+            return snapshot
+        except Exception as e:
+            logger.error(f"Error creating game state snapshot: {str(e)}", exc_info=True)
+            raise
+
+    @classmethod
+    def from_snapshot(cls, snapshot: dict, debug = False) -> 'GameState':
+        try:
+            logger.info("Restoring game state from snapshot")
+            game_state = cls(debug=debug)
+            for name, data in snapshot['players'].items():
+                game_state.players[name] = Player(name).from_dict(data)
+            for name, data in snapshot['npcs'].items():
+                game_state.npcs[name] = Npc(name).from_dict(data)
+            for name, data in snapshot['locations'].items():
+                game_state.locations[name] = Location(name, data['description']).from_dict(data)
+                game_state.location_graph.set_neighbours(name, data['neighbours'])
+            game_state.history = list(snapshot['history'])
+            for entry in game_state.history:
+                game_state.history_index.add(entry)
+            game_state.current_location = snapshot['current_location']
+            logger.info("Successfully restored game state from snapshot")
+            return game_state
+        except Exception as e:
+            logger.error(f"Error restoring game state from snapshot: {str(e)}", exc_info=True)
+            raise
+
     def print_state(self) -> None:
         try:
             logger.info("Printing game state")
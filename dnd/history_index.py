@@ -0,0 +1,60 @@
+import math
+import re
+
+TOKEN_PATTERN = re.compile(r"\w+")
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'has', 'he', 'her', 'his',
+    'in', 'is', 'it', 'its', 'of', 'on', 'or', 'she', 'that', 'the', 'their', 'they', 'this',
+    'to', 'was', 'were', 'with', 'you', 'your',
+}
+
+
+def tokenize(text: str) -> list:
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class HistoryIndex:
+    """
+    Incremental BM25 inverted index over history entries. Documents are identified
+    by their position in the history list, in insertion order.
+    """
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = {}
+        self.doc_lengths = []
+        self.total_length = 0
+
+    def add(self, text: str) -> int:
+        """
+        Index a history entry and return its doc id. Entries that aren't text are indexed as
+        empty documents, so doc ids keep matching positions in the history list.
+        """
+        doc_id = len(self.doc_lengths)
+        tokens = tokenize(text) if isinstance(text, str) else []
+        for token in tokens:
+            postings = self.postings.setdefault(token, {})
+            postings[doc_id] = postings.get(doc_id, 0) + 1
+        self.doc_lengths.append(len(tokens))
+        self.total_length += len(tokens)
+        return doc_id
+
+    def search(self, query: str, k: int = 5) -> list:
+        """
+        Return up to k (doc_id, score) pairs, best match first.
+        """
+        doc_count = len(self.doc_lengths)
+        if doc_count == 0 or k <= 0:
+            return []
+        average_length = self.total_length / doc_count or 1
+        scores = {}
+        for token in set(tokenize(query)):
+            postings = self.postings.get(token)
+            if not postings:
+                continue
+            idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, frequency in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+        return ranked[:k]
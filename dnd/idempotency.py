@@ -0,0 +1,72 @@
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# How long a completed result is served for repeated requests with the same key.
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv('IDEMPOTENCY_TTL_SECONDS', 300))
+
+
+class IdempotencyKeyReused(Exception):
+    """
+    Raised when a key is reused for a request that differs from the one it was first used for.
+    """
+    pass
+
+
+class _Entry:
+    def __init__(self, fingerprint=None):
+        self.fingerprint = fingerprint
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.expires_at = None
+
+
+class IdempotencyCache:
+    """
+    Runs a function at most once per key. Concurrent calls with the same key wait
+    for the in-flight call and share its result; completed results are kept for
+    ttl_seconds. Failures are not cached, so a retry after an error runs again.
+    The fingerprint identifies the request; reusing a key with another fingerprint
+    raises IdempotencyKeyReused instead of returning the other request's result.
+    """
+    def __init__(self, ttl_seconds: float = IDEMPOTENCY_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def run(self, key, function, fingerprint=None):
+        with self._lock:
+            self._evict(time.monotonic())
+            entry = self._entries.get(key)
+            owner = entry is None
+            if owner:
+                entry = self._entries[key] = _Entry(fingerprint)
+            elif entry.fingerprint != fingerprint:
+                logger.warning(f"Idempotency key reused with a different request: {key}")
+                raise IdempotencyKeyReused("Idempotency key was already used for a different request")
+        if owner:
+            try:
+                entry.result = function()
+            except Exception as e:
+                entry.error = e
+                with self._lock:
+                    self._entries.pop(key, None)
+            finally:
+                entry.expires_at = time.monotonic() + self.ttl_seconds
+                entry.done.set()
+        else:
+            logger.info(f"Joining request for idempotency key: {key}")
+            entry.done.wait()
+        if entry.error is not None:
+            raise entry.error
+        return entry.result
+
+    def _evict(self, now: float) -> None:
+        expired = [key for key, entry in self._entries.items()
+                   if entry.expires_at is not None and entry.expires_at <= now]
+        for key in expired:
+            del self._entries[key]
@@ -0,0 +1,83 @@
+from collections import deque
+
+
+class LocationGraph:
+    """
+    Undirected graph of locations built from each Location's neighbours list.
+    Adjacency and shortest paths are cached until a location's neighbours change.
+    """
+    def __init__(self):
+        self.declared = {}
+        self._adjacency = None
+        self._paths = {}
+
+    def set_neighbours(self, location_name: str, neighbours) -> None:
+        if isinstance(neighbours, str):
+            neighbours = [neighbours]
+        neighbours = {str(neighbour) for neighbour in neighbours or [] if neighbour != location_name}
+        if self.declared.get(location_name) == neighbours:
+            return
+        self.declared[location_name] = neighbours
+        self._adjacency = None
+        self._paths = {}
+
+    def adjacency(self) -> dict:
+        if self._adjacency is None:
+            adjacency = {}
+            for location_name, neighbours in self.declared.items():
+                adjacency.setdefault(location_name, set())
+                for neighbour in neighbours:
+                    adjacency[location_name].add(neighbour)
+                    adjacency.setdefault(neighbour, set()).add(location_name)
+            self._adjacency = adjacency
+        return self._adjacency
+
+    def shortest_path(self, source: str, target: str):
+        """
+        Return the list of locations from source to target, or None if they are not connected.
+        """
+        key = (source, target)
+        if key not in self._paths:
+            self._paths[key] = self._search(source, target)
+        return self._paths[key]
+
+    def within_hops(self, source: str, max_hops: int) -> dict:
+        """
+        Return {location: hops} for every location reachable from source in at most max_hops.
+        A max_hops below 1 returns nothing rather than the whole connected world.
+        """
+        adjacency = self.adjacency()
+        if source not in adjacency or max_hops < 1:
+            return {}
+        distances = {source: 0}
+        queue = deque([source])
+        while queue:
+            current = queue.popleft()
+            if distances[current] >= max_hops:
+                continue
+            for neighbour in adjacency[current]:
+                if neighbour not in distances:
+                    distances[neighbour] = distances[current] + 1
+                    queue.append(neighbour)
+        del distances[source]
+        return distances
+
+    def _search(self, source: str, target: str):
+        adjacency = self.adjacency()
+        if source not in adjacency or target not in adjacency:
+            return None
+        previous = {source: None}
+        queue = deque([source])
+        while queue:
+            current = queue.popleft()
+            if current == target:
+                path = []
+                while current is not None:
+                    path.append(current)
+                    current = previous[current]
+                return path[::-1]
+            for neighbour in sorted(adjacency[current]):
+                if neighbour not in previous:
+                    previous[neighbour] = current
+                    queue.append(neighbour)
+        return None
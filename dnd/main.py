@@ -2,10 +2,21 @@ import logging
 from datetime import datetime
 import os
 from dotenv import load_dotenv
-from game import Game
-from fastapi import FastAPI, HTTPException
+from game import Game, GameUnloaded
+from oplog import GAME_DATA_DIR, open_oplog
+from responses import CachedPayload, state_response
+from snapshot import MAX_SNAPSHOT_UPLOAD_BYTES
+from round_batcher import ROUND_MODE
+from idempotency import IdempotencyCache, IdempotencyKeyReused
+from admission import admission
+from model_router import model_router
+import threading
+import time
+from fastapi import FastAPI, Header, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
+from typing import Optional
 import uvicorn
 
 # Load environment variables
@@ -40,11 +51,119 @@ app.add_middleware(
 )
 
 game_map = {}
+# Game ids being created or recovered, each with an event set when loading finishes.
+loading_games = {}
+loading_games_lock = threading.Lock()
+unload_lock = threading.Lock()
+player_actions = IdempotencyCache()
+# Without durable storage games can't be unloaded, so hitting the live game limit is permanent.
+GAMES_UNLOADABLE = bool(GAME_DATA_DIR)
+
+def load_game(game_id: str, load):
+    """
+    Put the game returned by load() in game_map. Concurrent callers for the same id wait
+    for the load in progress and get its game instead of loading it again.
+    """
+    while True:
+        with loading_games_lock:
+            game = game_map.get(game_id)
+            if game is not None:
+                return game
+            done = loading_games.get(game_id)
+            if done is None:
+                done = loading_games[game_id] = threading.Event()
+                break
+        logger.info(f"Waiting for game {game_id} to finish loading")
+        done.wait()
+    try:
+        game = load()
+        if game is not None:
+            game_map[game_id] = game
+        return game
+    finally:
+        with loading_games_lock:
+            del loading_games[game_id]
+        done.set()
+
+def make_room():
+    """
+    Unload least recently used idle games until another one fits under the live game limit.
+    Unloaded games are recovered from their operation log on next use.
+    """
+    with unload_lock:
+        for game_id, game in sorted(list(game_map.items()), key=lambda item: item[1].last_used):
+            if len(game_map) < admission.max_live_games:
+                break
+            if game.unload():
+                game_map.pop(game_id, None)
+                logger.info(f"Unloaded idle game: {game_id}")
+
+def recover_game(game_id: str):
+    oplog = open_oplog(game_id)
+    if oplog is None or not oplog.exists():
+        return None
+    make_room()
+    admission.check_live_games(len(game_map), retryable=GAMES_UNLOADABLE)
+    return Game.recover(game_id)
+
+def find_game(game_id: str):
+    """
+    Return a live game, recovering it from durable storage if this process doesn't hold it yet.
+    """
+    game = game_map.get(game_id) or load_game(game_id, lambda: recover_game(game_id))
+    if game is not None:
+        game.last_used = time.monotonic()
+    return game
+
+def create_game(game_id: str):
+    """
+    Create a new game under admission control. Callers creating the same game id at once share one creation.
+    """
+    def build():
+        make_room()
+        with admission.create_game(len(game_map), retryable=GAMES_UNLOADABLE):
+            logger.info(f"Creating new game instance for game_id: {game_id}")
+            return Game(game_id)
+    return load_game(game_id, build)
+
+def add_new_game(game_id: str, build):
+    """
+    Put the game returned by build() in game_map under the live game limit. Returns None,
+    without building, if the game id is already live or persisted or a concurrent request loaded it first.
+    """
+    if find_game(game_id) is not None:
+        return None
+    built = []
+    def load():
+        make_room()
+        admission.check_live_games(len(game_map), retryable=GAMES_UNLOADABLE)
+        built.append(build())
+        return built[0]
+    game = load_game(game_id, load)
+    return game if built else None
+
+def run_game_turn(game_id: str, turn, create: bool = False):
+    """
+    Run turn(game) on a live game, creating it if asked. If the game is unloaded between
+    lookup and the turn, the turn runs again on the recovered game.
+    """
+    while True:
+        game = find_game(game_id)
+        if game is None:
+            if not create:
+                logger.error(f"Game not found: {game_id}")
+                raise HTTPException(status_code=400, detail="Game not found")
+            game = create_game(game_id)
+        try:
+            return turn(game)
+        except GameUnloaded:
+            logger.info(f"Game {game_id} was unloaded during the request, retrying")
 
 class PlayerAction(BaseModel):
     game_id: str
     player_name: str
     action: str
+    idempotency_key: Optional[str] = None
 
 class NewPlayer(BaseModel):
     game_id: str
@@ -56,6 +175,13 @@ class Player(BaseModel):
     player_name: str
     player_state: dict
 
+class NewGame(BaseModel):
+    game_id: str
+
+class ForkGame(BaseModel):
+    source_game_id: str
+    game_id: str
+
 @app.post("/add_player/")
 def add_player(new_player: NewPlayer):
     try:
@@ -68,44 +194,94 @@ def add_player(new_player: NewPlayer):
         logger.error(f"Error adding player {new_player.player_name}: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/create_game/")
+def create_new_game(new_game: NewGame):
+    try:
+        logger.info(f"Creating game: {new_game.game_id}")
+        if find_game(new_game.game_id) is not None:
+            logger.info(f"Game already exists: {new_game.game_id}")
+            return {"message": f"Game {new_game.game_id} already exists."}
+        create_game(new_game.game_id)
+        logger.info(f"Successfully created game: {new_game.game_id}")
+        return {"message": f"Game {new_game.game_id} created successfully."}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error creating game {new_game.game_id}: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+def resolve_player_action(action: PlayerAction):
+    if ROUND_MODE:
+        return run_game_turn(action.game_id, lambda game: game.submit_round_action(action.player_name, action.action),
+                             create=True)
+    return run_game_turn(action.game_id, lambda game: game.update_game(action.action), create=True)
+
 @app.post("/player_action/")
-def player_action(action: PlayerAction):
+def player_action(action: PlayerAction, idempotency_key: Optional[str] = Header(None)):
     try:
         logger.info(f"Processing action for player {action.player_name} in game {action.game_id}")
-        if action.game_id not in game_map:
-            logger.info(f"Creating new game instance for game_id: {action.game_id}")
-            game_map[action.game_id] = Game(action.game_id)
-        response = game_map[action.game_id].update_game(action.action)
+        key = action.idempotency_key or idempotency_key
+        if key:
+            # Retries and double submissions with the same key share one DM turn.
+            response = player_actions.run((action.game_id, action.player_name, key),
+                                          lambda: resolve_player_action(action), fingerprint=action.action)
+        else:
+            response = resolve_player_action(action)
         logger.info(f"Action processed successfully for player {action.player_name}")
         return {"dm_response": response}
+    except HTTPException:
+        raise
+    except IdempotencyKeyReused as e:
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
         logger.error(f"Error processing action for player {action.player_name}: {str(e)}", exc_info=True)
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/game_history/")
-def get_game_history(game_id: str):
+def get_game_history(game_id: str, request: Request):
     try:
         logger.info(f"Retrieving game history for game_id: {game_id}")
-        if game_id not in game_map:
-            logger.info(f"Creating new game instance for game_id: {game_id}")
-            game_map[game_id] = Game(game_id)
-        history = game_map[game_id].get_game_history()
+        game = find_game(game_id)
+        if game is None:
+            logger.error(f"Game not found: {game_id}")
+            raise HTTPException(status_code=400, detail="Game not found")
+        payload = game.get_payload("history", lambda: {"history": game.get_game_history()})
         logger.info(f"Successfully retrieved game history for game_id: {game_id}")
-        return {"history": history}
+        return state_response(request, payload)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error retrieving game history for game_id {game_id}: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/search_history/")
+def search_history(game_id: str, query: str, k: int = 5):
+    try:
+        logger.info(f"Searching game history for game_id: {game_id}")
+        game = find_game(game_id)
+        if game is None:
+            logger.error(f"Game not found: {game_id}")
+            raise HTTPException(status_code=400, detail="Game not found")
+        results = game.search_game_history(query, k)
+        logger.info(f"Successfully searched game history for game_id: {game_id}")
+        return {"results": results}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error searching game history for game_id {game_id}: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/players_state/")
-def get_players_state(game_id: str):
+def get_players_state(game_id: str, request: Request):
     try:
         logger.info(f"Retrieving players state for game_id: {game_id}")
-        if game_id not in game_map:
+        game = find_game(game_id)
+        if game is None:
             logger.error(f"Game not found: {game_id}")
             raise HTTPException(status_code=400, detail="Game not found")
-        state = game_map[game_id].get_players_state()
+        payload = game.get_payload("players_state", lambda: {"players_state": game.get_players_state()})
         logger.info(f"Successfully retrieved players state for game_id: {game_id}")
-        return {"players_state": state}
+        return state_response(request, payload)
     except HTTPException:
         raise
     except Exception as e:
@@ -113,15 +289,16 @@ def get_players_state(game_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/npcs_state/")
-def get_npcs_state(game_id: str):
+def get_npcs_state(game_id: str, request: Request):
     try:
         logger.info(f"Retrieving NPCs state for game_id: {game_id}")
-        if game_id not in game_map:
+        game = find_game(game_id)
+        if game is None:
             logger.error(f"Game not found: {game_id}")
             raise HTTPException(status_code=400, detail="Game not found")
-        state = game_map[game_id].get_npcs_state()
+        payload = game.get_payload("npcs_state", lambda: {"npcs_state": game.get_npcs_state()})
         logger.info(f"Successfully retrieved NPCs state for game_id: {game_id}")
-        return {"npcs_state": state}
+        return state_response(request, payload)
     except HTTPException:
         raise
     except Exception as e:
@@ -129,15 +306,16 @@ def get_npcs_state(game_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/locations_state/")
-def get_locations_state(game_id: str):
+def get_locations_state(game_id: str, request: Request):
     try:
         logger.info(f"Retrieving locations state for game_id: {game_id}")
-        if game_id not in game_map:
+        game = find_game(game_id)
+        if game is None:
             logger.error(f"Game not found: {game_id}")
             raise HTTPException(status_code=400, detail="Game not found")
-        state = game_map[game_id].get_locations_state()
+        payload = game.get_payload("locations_state", lambda: {"locations_state": game.get_locations_state()})
         logger.info(f"Successfully retrieved locations state for game_id: {game_id}")
-        return {"locations_state": state}
+        return state_response(request, payload)
     except HTTPException:
         raise
     except Exception as e:
@@ -145,15 +323,20 @@ def get_locations_state(game_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/player_state/{player_name}")
-def get_state_for_player(player_name: str, game_id: str):
+def get_state_for_player(player_name: str, game_id: str, request: Request):
     try:
         logger.info(f"Retrieving state for player {player_name} in game {game_id}")
-        if game_id not in game_map:
+        game = find_game(game_id)
+        if game is None:
             logger.error(f"Game not found: {game_id}")
             raise HTTPException(status_code=400, detail="Game not found")
-        state = game_map[game_id].get_state_for_player(player_name)
+        if player_name in game.game_state.players:
+            payload = game.get_payload(("player_state", player_name), lambda: game.get_state_for_player(player_name))
+        else:
+            # Unknown names are not cached, so arbitrary URLs can't grow the payload cache.
+            payload = CachedPayload(game.get_state_for_player(player_name))
         logger.info(f"Successfully retrieved state for player {player_name}")
-        return state
+        return state_response(request, payload)
     except HTTPException:
         raise
     except Exception as e:
@@ -164,10 +347,7 @@ def get_state_for_player(player_name: str, game_id: str):
 def update_player(player: Player):
     try:
         logger.info(f"Updating player {player.player_name} in game {player.game_id}")
-        if player.game_id not in game_map:
-            logger.error(f"Game not found: {player.game_id}")
-            raise HTTPException(status_code=400, detail="Game not found")
-        game_map[player.game_id].update_player(player.player_name, player.player_state)
+        run_game_turn(player.game_id, lambda game: game.update_player(player.player_name, player.player_state))
         logger.info(f"Successfully updated player {player.player_name}")
         return {"message": "Player updated successfully"}
     except HTTPException:
@@ -179,10 +359,11 @@ def update_player(player: Player):
 @app.get("/game_checksum/")
 def get_game_checksum(game_id: str):
     try:
-        if game_id not in game_map:
+        game = find_game(game_id)
+        if game is None:
             logger.error(f"Game not found: {game_id}")
             raise HTTPException(status_code=400, detail="Game not found")
-        checksum = game_map[game_id].get_game_checksum()
+        checksum = game.get_game_checksum()
         return {"game_checksum": checksum}
     except HTTPException:
         raise
@@ -190,6 +371,81 @@ def get_game_checksum(game_id: str):
         logger.error(f"Error retrieving game checksum for game_id {game_id}: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/game_snapshot/")
+def get_game_snapshot(game_id: str):
+    try:
+        logger.info(f"Creating snapshot for game_id: {game_id}")
+        game = find_game(game_id)
+        if game is None:
+            logger.error(f"Game not found: {game_id}")
+            raise HTTPException(status_code=400, detail="Game not found")
+        snapshot = game.snapshot()
+        logger.info(f"Successfully created snapshot for game_id: {game_id}")
+        return Response(content=snapshot, media_type="application/octet-stream")
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error creating snapshot for game_id {game_id}: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def read_snapshot_upload(request: Request) -> bytes:
+    too_large = HTTPException(status_code=413, detail=f"Snapshot exceeds {MAX_SNAPSHOT_UPLOAD_BYTES} bytes")
+    content_length = request.headers.get('content-length')
+    if content_length and content_length.isdigit() and int(content_length) > MAX_SNAPSHOT_UPLOAD_BYTES:
+        raise too_large
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > MAX_SNAPSHOT_UPLOAD_BYTES:
+            raise too_large
+    return bytes(body)
+
+@app.post("/restore_game/")
+async def restore_game(game_id: str, request: Request):
+    try:
+        logger.info(f"Restoring game_id: {game_id} from snapshot")
+        if await run_in_threadpool(find_game, game_id) is not None:
+            logger.error(f"Game already exists: {game_id}")
+            raise HTTPException(status_code=400, detail="Game already exists")
+        snapshot = await read_snapshot_upload(request)
+        if await run_in_threadpool(add_new_game, game_id, lambda: Game(game_id, snapshot)) is None:
+            logger.error(f"Game already exists: {game_id}")
+            raise HTTPException(status_code=400, detail="Game already exists")
+        logger.info(f"Successfully restored game_id: {game_id}")
+        return {"message": f"Game {game_id} restored successfully."}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error restoring game_id {game_id}: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/fork_game/")
+def fork_game(fork: ForkGame):
+    try:
+        logger.info(f"Forking game {fork.game_id} from {fork.source_game_id}")
+        source = find_game(fork.source_game_id)
+        if source is None:
+            logger.error(f"Game not found: {fork.source_game_id}")
+            raise HTTPException(status_code=400, detail="Game not found")
+        if find_game(fork.game_id) is not None:
+            logger.error(f"Game already exists: {fork.game_id}")
+            raise HTTPException(status_code=400, detail="Game already exists")
+        snapshot = source.snapshot()
+        if add_new_game(fork.game_id, lambda: Game.fork(fork.game_id, snapshot)) is None:
+            logger.error(f"Game already exists: {fork.game_id}")
+            raise HTTPException(status_code=400, detail="Game already exists")
+        logger.info(f"Successfully forked game {fork.game_id} from {fork.source_game_id}")
+        return {"message": f"Game {fork.game_id} forked from {fork.source_game_id}."}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error forking game {fork.game_id}: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/model_metrics/")
+def get_model_metrics():
+    return {"model_metrics": model_router.metrics()}
+
 if __name__ == "__main__":
     port = int(os.getenv('PORT', 8000))
     host = os.getenv('HOST', '0.0.0.0')
@@ -0,0 +1,122 @@
+import logging
+import os
+import re
+import threading
+from collections import deque
+from round_batcher import ROUND_PROMPT_HEADER
+
+logger = logging.getLogger(__name__)
+
+MODEL_TIERS = {
+    'fast': os.getenv('DM_MODEL_FAST', 'gemini-2.0-flash'),
+    'full': os.getenv('DM_MODEL_FULL', 'gemini-2.5-flash-preview-04-17'),
+}
+
+# state_update turns notify the DM of a state change made outside the chat; they are
+# passed explicitly by the caller rather than classified.
+TURN_CLASSES = ['dialogue', 'state_query', 'state_update', 'combat', 'scene_generation']
+
+# Tier used for each turn class; override with e.g. DM_ROUTE_DIALOGUE=full.
+ROUTES = {
+    'dialogue': os.getenv('DM_ROUTE_DIALOGUE', 'fast'),
+    'state_query': os.getenv('DM_ROUTE_STATE_QUERY', 'fast'),
+    'state_update': os.getenv('DM_ROUTE_STATE_UPDATE', 'fast'),
+    'combat': os.getenv('DM_ROUTE_COMBAT', 'full'),
+    'scene_generation': os.getenv('DM_ROUTE_SCENE_GENERATION', 'full'),
+}
+
+# Latency samples kept per tier for percentiles.
+METRICS_WINDOW = int(os.getenv('DM_MODEL_METRICS_WINDOW', 500))
+
+# Keyword heuristics over the declared actions; the first matching class in classify_turn wins.
+COMBAT_PATTERN = re.compile(
+    r"\b(attack\w*|strikes?|striking|hits?\b(?!\s+the\s+(?:road|trail|hay|sack))|stab\w*|slash\w*|shoot\w*|fire at|"
+    r"cast(?:s|ing)?|fight(?:s|ing)?|kill(?:s|ed|ing)?|punch\w*|dodge\w*|parry|block\w*|grapple\w*|charg(?:e|es|ed|ing)|damage|initiative|rolled|roll(?:ed)? a|d(?:4|6|8|10|12|20|100))\b",
+    re.IGNORECASE)
+SCENE_PATTERN = re.compile(
+    r"\b(go|goes|going|walk\w*|travel\w*|head(?:s|ed|ing)?|enter\w*|leave\w*|explore\w*|search\w*|open\w*|climb\w*|"
+    r"follow\w*|journey|arrive\w*|look around|investigate\w*|rest\w*|sleep\w*)\b",
+    re.IGNORECASE)
+QUERY_PATTERN = re.compile(
+    r"(\?|\b(what|who|where|which|how many|how much|list|show|status|state|inventory|stats|remind)\b)",
+    re.IGNORECASE)
+DIALOGUE_PATTERN = re.compile(
+    r"(\"|“|\b(say\w*|said|ask\w*|tell\w*|talk\w*|speak\w*|greet\w*|reply|replies|whisper\w*|shout\w*|"
+    r"persuade\w*|bargain\w*|haggle\w*|thank\w*)\b)",
+    re.IGNORECASE)
+# The "<Player_Name> Action:" / "Dungeon Master Action:" prefix of each action line.
+ACTION_PREFIX_PATTERN = re.compile(r"^[^\n:]*\bAction:[ \t]*", re.MULTILINE)
+DM_ACTION_PREFIX = 'Dungeon Master Action:'
+
+
+def action_text(message: str) -> str:
+    """
+    Strip the round header and the action prefixes, so player names don't affect the classification.
+    """
+    lines = [line for line in message.splitlines() if line.strip() != ROUND_PROMPT_HEADER]
+    return ACTION_PREFIX_PATTERN.sub('', '\n'.join(lines))
+
+
+def classify_turn(message: str) -> str:
+    """
+    Classify a DM turn from its prompt with cheap local heuristics. Anything that
+    doesn't clearly fit a lighter class is treated as scene generation.
+    """
+    text = action_text(message)
+    if COMBAT_PATTERN.search(text):
+        return 'combat'
+    if SCENE_PATTERN.search(text):
+        return 'scene_generation'
+    if message.lstrip().startswith(DM_ACTION_PREFIX) and QUERY_PATTERN.search(text):
+        return 'state_query'
+    if DIALOGUE_PATTERN.search(text):
+        return 'dialogue'
+    if QUERY_PATTERN.search(text):
+        return 'state_query'
+    return 'scene_generation'
+
+
+class ModelRouter:
+    """
+    Maps turn classes to model tiers and keeps per-tier latency metrics.
+    """
+    def __init__(self, tiers: dict = None, routes: dict = None, window: int = METRICS_WINDOW):
+        self.tiers = dict(tiers or MODEL_TIERS)
+        self.routes = dict(routes or ROUTES)
+        for turn_class, tier in self.routes.items():
+            if tier not in self.tiers:
+                logger.warning(f"Unknown tier {tier} for {turn_class} turns, using full")
+                self.routes[turn_class] = 'full'
+        self._samples = {tier: deque(maxlen=window) for tier in self.tiers}
+        self._counts = {tier: {turn_class: 0 for turn_class in TURN_CLASSES} for tier in self.tiers}
+        self._lock = threading.Lock()
+
+    def tier_for(self, turn_class: str) -> str:
+        return self.routes.get(turn_class, 'full')
+
+    def model_for(self, turn_class: str) -> str:
+        return self.tiers[self.tier_for(turn_class)]
+
+    def record(self, tier: str, turn_class: str, seconds: float) -> None:
+        with self._lock:
+            self._samples[tier].append(seconds)
+            self._counts[tier][turn_class] += 1
+
+    def metrics(self) -> dict:
+        with self._lock:
+            metrics = {}
+            for tier, model in self.tiers.items():
+                samples = sorted(self._samples[tier])
+                metrics[tier] = {
+                    'model': model,
+                    'turns': dict(self._counts[tier]),
+                    'samples': len(samples),
+                    'mean_ms': round(1000 * sum(samples) / len(samples), 1) if samples else None,
+                    'p50_ms': round(1000 * samples[len(samples) // 2], 1) if samples else None,
+                    'p95_ms': round(1000 * samples[min(len(samples) - 1, int(len(samples) * 0.95))], 1) if samples else None,
+                    'max_ms': round(1000 * samples[-1], 1) if samples else None,
+                }
+            return metrics
+
+
+model_router = ModelRouter()
@@ -0,0 +1,171 @@
+import json
+import logging
+import os
+import threading
+from urllib.parse import quote
+
+logger = logging.getLogger(__name__)
+
+# Directory holding per-game snapshots and operation logs. Durability is disabled when unset.
+GAME_DATA_DIR = os.getenv('GAME_DATA_DIR', '')
+OPLOG_FSYNC = os.getenv('OPLOG_FSYNC', '1') == '1'
+# Buffer a turn's records and write them with one fsync in flush(); set to 0 to write each record as it is appended.
+OPLOG_GROUP_COMMIT = os.getenv('OPLOG_GROUP_COMMIT', '1') == '1'
+OPLOG_COMPACT_EVERY = int(os.getenv('OPLOG_COMPACT_EVERY', 500))
+
+
+class OpLog:
+    """
+    Append-only log of game mutations with periodic compaction into a snapshot.
+
+    Each record is one JSON line: {"seq": <n>, "op": <name>, "args": [...]}.
+    The snapshot file starts with the sequence number of the last operation it
+    contains, so records that were already compacted are skipped on replay even
+    if the process died between writing the snapshot and truncating the log.
+
+    With group commit, appended records are buffered until flush(), so a turn's
+    operations reach the disk with a single write and fsync.
+    """
+    def __init__(self, directory: str, game_id: str, fsync: bool = OPLOG_FSYNC,
+                 compact_every: int = OPLOG_COMPACT_EVERY, group_commit: bool = OPLOG_GROUP_COMMIT):
+        base = os.path.join(directory, quote(game_id, safe=''))
+        self.log_path = base + '.log'
+        self.snapshot_path = base + '.snap'
+        self.fsync = fsync
+        self.compact_every = compact_every
+        self.group_commit = group_commit
+        self.seq = 0
+        self.ops_since_compaction = 0
+        self._file = None
+        self._pending = []
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def exists(self) -> bool:
+        return os.path.exists(self.snapshot_path) or os.path.exists(self.log_path)
+
+    def reset(self) -> None:
+        with self._lock:
+            logger.info(f"Resetting operation log: {self.log_path}")
+            self._close()
+            self._pending = []
+            for path in (self.log_path, self.snapshot_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self.seq = 0
+            self.ops_since_compaction = 0
+
+    def append(self, op: str, args: list) -> int:
+        with self._lock:
+            self.seq += 1
+            record = json.dumps({'seq': self.seq, 'op': op, 'args': args}, separators=(',', ':'))
+            self._pending.append(record + '\n')
+            if not self.group_commit:
+                self._flush()
+            self.ops_since_compaction += 1
+            return self.seq
+
+    def flush(self) -> None:
+        """
+        Write the buffered records, then fsync once if enabled.
+        """
+        with self._lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._pending:
+            return
+        if self._file is None:
+            self._file = open(self.log_path, 'a', encoding='utf-8')
+        self._file.write(''.join(self._pending))
+        self._pending = []
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def load(self):
+        """
+        Return the last snapshot (or None) and the operation records written after it.
+        """
+        with self._lock:
+            snapshot = None
+            snapshot_seq = 0
+            if os.path.exists(self.snapshot_path):
+                with open(self.snapshot_path, 'rb') as f:
+                    snapshot_seq = int.from_bytes(f.read(8), 'big')
+                    snapshot = f.read()
+            records = []
+            if os.path.exists(self.log_path):
+                valid_length = 0
+                torn = False
+                with open(self.log_path, 'rb') as f:
+                    for line in f:
+                        try:
+                            if not line.endswith(b'\n'):
+                                raise ValueError("missing record terminator")
+                            record = json.loads(line)
+                        except ValueError:
+                            # A torn final write from a crash; everything before it is intact.
+                            logger.warning(f"Ignoring incomplete record in {self.log_path}")
+                            torn = True
+                            break
+                        valid_length += len(line)
+                        if record['seq'] > snapshot_seq:
+                            records.append(record)
+                if torn:
+                    # Cut the torn bytes off so the next append starts on a fresh line.
+                    self._close()
+                    with open(self.log_path, 'r+b') as f:
+                        f.truncate(valid_length)
+                        f.flush()
+                        os.fsync(f.fileno())
+            self.seq = records[-1]['seq'] if records else snapshot_seq
+            self.ops_since_compaction = len(records)
+            return snapshot, records
+
+    def should_compact(self) -> bool:
+        return self.ops_since_compaction >= self.compact_every
+
+    def compact(self, snapshot: bytes, seq: int = None) -> None:
+        """
+        Persist a snapshot covering every operation up to seq (by default, all appended so far).
+        The log is truncated only if nothing was appended after seq; otherwise it is kept and
+        the already-covered records are skipped on replay.
+        """
+        with self._lock:
+            seq = self.seq if seq is None else seq
+            logger.info(f"Compacting operation log {self.log_path} at seq {seq}")
+            if seq != self.seq:
+                # Records after seq aren't in the snapshot and must reach the log.
+                self._flush()
+            tmp_path = self.snapshot_path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(seq.to_bytes(8, 'big'))
+                f.write(snapshot)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+            if seq == self.seq:
+                self._pending = []
+                self._close()
+                open(self.log_path, 'w').close()
+            self.ops_since_compaction = self.seq - seq
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush()
+            self._close()
+
+    def _close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def open_oplog(game_id: str):
+    """
+    Return the operation log for a game, or None when durability is disabled.
+    """
+    if not GAME_DATA_DIR:
+        return None
+    return OpLog(GAME_DATA_DIR, game_id)
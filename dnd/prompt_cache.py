@@ -0,0 +1,100 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+PROMPT_CACHE_ENABLED = os.getenv('DM_PROMPT_CACHE', '1') == '1'
+PROMPT_CACHE_TTL_SECONDS = int(os.getenv('DM_PROMPT_CACHE_TTL', 3600))
+# Refresh the cache this many seconds before it would expire, so chats never
+# reference a cache the provider has already dropped.
+PROMPT_CACHE_REFRESH_MARGIN_SECONDS = int(os.getenv('DM_PROMPT_CACHE_REFRESH_MARGIN', 300))
+# After a failed cache creation, don't retry for this many seconds.
+PROMPT_CACHE_RETRY_SECONDS = int(os.getenv('DM_PROMPT_CACHE_RETRY', 600))
+
+
+def prompt_version(system_instruction: str) -> str:
+    """
+    Short hash identifying a version of the system instruction.
+    """
+    return hashlib.sha256(system_instruction.encode('utf-8')).hexdigest()[:12]
+
+
+class PromptCache:
+    """
+    Process-wide registry of provider-side cached contents holding the static DM
+    system instruction and tool declarations. One cache is kept per model and
+    prompt version and shared by every DM_Agent chat.
+    """
+    def __init__(self, ttl_seconds: int = PROMPT_CACHE_TTL_SECONDS,
+                 refresh_margin_seconds: int = PROMPT_CACHE_REFRESH_MARGIN_SECONDS,
+                 retry_seconds: int = PROMPT_CACHE_RETRY_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self.retry_seconds = retry_seconds
+        self._entries = {}
+        self._failed_at = {}
+        self._lock = threading.Lock()
+
+    def get_cached_content(self, client, model: str, system_instruction: str, tools: list):
+        """
+        Return the name of a live cached content for this model and prompt, creating
+        or refreshing it when needed. Returns None when caching is unavailable so the
+        caller can fall back to sending the system instruction with each request.
+        """
+        from google.genai import types
+        key = (model, prompt_version(system_instruction))
+        with self._lock:
+            now = time.monotonic()
+            if key in self._failed_at and now < self._failed_at[key] + self.retry_seconds:
+                return None
+            entry = self._entries.get(key)
+            if entry and now < entry['expires_at'] - self.refresh_margin_seconds:
+                return entry['name']
+            if entry and now < entry['expires_at']:
+                if self._extend(client, entry):
+                    return entry['name']
+            try:
+                logger.info(f"Creating prompt cache for model {model}, version {key[1]}")
+                cached = client.caches.create(
+                    model=model,
+                    config=types.CreateCachedContentConfig(
+                        display_name=f"dm-prompt-{key[1]}",
+                        system_instruction=system_instruction,
+                        tools=tools,
+                        ttl=f"{self.ttl_seconds}s",
+                    ),
+                )
+                self._failed_at.pop(key, None)
+                self._entries[key] = {
+                    'name': cached.name,
+                    'expires_at': time.monotonic() + self.ttl_seconds,
+                }
+                logger.info(f"Successfully created prompt cache: {cached.name}")
+                return cached.name
+            except Exception as e:
+                # Typically the prompt is below the model's minimum cacheable size or
+                # the model does not support explicit caching; don't retry every game.
+                logger.warning(f"Prompt caching unavailable for model {model}: {str(e)}")
+                self._failed_at[key] = time.monotonic()
+                self._entries.pop(key, None)
+                return None
+
+    def _extend(self, client, entry) -> bool:
+        from google.genai import types
+        try:
+            logger.info(f"Extending prompt cache: {entry['name']}")
+            client.caches.update(
+                name=entry['name'],
+                config=types.UpdateCachedContentConfig(ttl=f"{self.ttl_seconds}s"),
+            )
+            entry['expires_at'] = time.monotonic() + self.ttl_seconds
+            return True
+        except Exception as e:
+            logger.warning(f"Error extending prompt cache {entry['name']}: {str(e)}")
+            return False
+
+
+prompt_cache = PromptCache()
@@ -0,0 +1,78 @@
+import gzip
+import logging
+import os
+import threading
+import orjson
+from fastapi import Request, Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Responses smaller than this are sent uncompressed.
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', 1024))
+GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', 5))
+BROTLI_QUALITY = int(os.getenv('BROTLI_QUALITY', 5))
+
+
+def dumps(content) -> bytes:
+    return orjson.dumps(content)
+
+
+class CachedPayload:
+    """
+    A serialized JSON body plus lazily compressed variants of it, so repeated reads
+    of unchanged state skip both serialization and compression.
+    """
+    def __init__(self, content):
+        self.body = dumps(content)
+        self._encoded = {}
+        self._lock = threading.Lock()
+
+    def encoded(self, encoding: str) -> bytes:
+        with self._lock:
+            if encoding not in self._encoded:
+                if encoding == 'br':
+                    self._encoded[encoding] = brotli.compress(self.body, quality=BROTLI_QUALITY)
+                else:
+                    self._encoded[encoding] = gzip.compress(self.body, compresslevel=GZIP_LEVEL)
+            return self._encoded[encoding]
+
+
+def _accepted_encodings(accept_encoding: str) -> set:
+    accepted = set()
+    for token in accept_encoding.split(','):
+        name, _, params = token.strip().partition(';')
+        if params.strip().replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+
+def choose_encoding(request: Request, size: int):
+    if size < COMPRESSION_MIN_SIZE:
+        return None
+    accepted = _accepted_encodings(request.headers.get('accept-encoding', ''))
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def state_response(request: Request, payload: CachedPayload) -> Response:
+    """
+    Build a JSON response from a cached payload, compressed when the client accepts it
+    and the body is above COMPRESSION_MIN_SIZE.
+    """
+    headers = {'Vary': 'Accept-Encoding'}
+    encoding = choose_encoding(request, len(payload.body))
+    if encoding is None:
+        body = payload.body
+    else:
+        body = payload.encoded(encoding)
+        headers['Content-Encoding'] = encoding
+    return Response(content=body, media_type='application/json', headers=headers)
@@ -0,0 +1,83 @@
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+ROUND_MODE = os.getenv('ROUND_MODE', '0') == '1'
+# How long a round stays open for other players' actions, unless everyone acts sooner.
+ROUND_WINDOW_SECONDS = float(os.getenv('ROUND_WINDOW_SECONDS', 5))
+
+ROUND_PROMPT_HEADER = "Round Actions: the following actions happen simultaneously this round. Resolve them together in a single narrative."
+
+
+class Round:
+    def __init__(self):
+        self.actions = []
+        self.complete = threading.Event()
+        self.resolved = threading.Event()
+        self.response = None
+        self.error = None
+
+    def players(self) -> set:
+        return {player_name for player_name, _ in self.actions}
+
+
+def combine_actions(actions: list) -> str:
+    if len(actions) == 1:
+        return actions[0][1]
+    return "\n".join([ROUND_PROMPT_HEADER] + [action for _, action in actions])
+
+
+class RoundBatcher:
+    """
+    Collects the actions of all players of a game into rounds. The first action
+    opens a round; it closes when every known player has acted or the window
+    elapses, and is resolved with a single DM turn whose narrative is returned
+    to every player who acted in it.
+    """
+    def __init__(self, game, window_seconds: float = ROUND_WINDOW_SECONDS):
+        self.game = game
+        self.window_seconds = window_seconds
+        self._round = None
+        self._lock = threading.Lock()
+        # Rounds are resolved one at a time, in order.
+        self._turn_lock = threading.Lock()
+
+    def is_open(self) -> bool:
+        with self._lock:
+            return self._round is not None
+
+    def submit(self, player_name: str, action: str) -> str:
+        with self._lock:
+            current = self._round
+            leader = current is None
+            if leader:
+                current = self._round = Round()
+                logger.info(f"Opening round for game {self.game.name}")
+            current.actions.append((player_name, action))
+            party = set(self.game.game_state.players.keys())
+            if party and party <= current.players():
+                current.complete.set()
+        if leader:
+            self._resolve(current)
+        else:
+            current.resolved.wait()
+        if current.error is not None:
+            raise current.error
+        return current.response
+
+    def _resolve(self, current: Round) -> None:
+        current.complete.wait(self.window_seconds)
+        with self._lock:
+            # Actions arriving from now on open the next round.
+            self._round = None
+        try:
+            with self._turn_lock:
+                logger.info(f"Resolving round of {len(current.actions)} actions for game {self.game.name}")
+                current.response = self.game.update_game(combine_actions(current.actions))
+        except Exception as e:
+            logger.error(f"Error resolving round for game {self.game.name}: {str(e)}", exc_info=True)
+            current.error = e
+        finally:
+            current.resolved.set()
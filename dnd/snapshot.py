@@ -0,0 +1,46 @@
+import json
+import logging
+import os
+import zlib
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b'DNDS'
+SNAPSHOT_VERSION = 1
+# Limits on untrusted snapshots: the compressed upload and the decompressed JSON.
+MAX_SNAPSHOT_UPLOAD_BYTES = int(os.getenv('MAX_SNAPSHOT_UPLOAD_BYTES', 16 * 1024 * 1024))
+MAX_SNAPSHOT_BYTES = int(os.getenv('MAX_SNAPSHOT_BYTES', 64 * 1024 * 1024))
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def encode_snapshot(data: dict) -> bytes:
+    """
+    Serialize a game snapshot (plain dicts, lists, numbers and strings) to a compact binary blob.
+    """
+    header = SNAPSHOT_MAGIC + SNAPSHOT_VERSION.to_bytes(2, 'big')
+    payload = json.dumps(data, separators=(',', ':')).encode('utf-8')
+    return header + zlib.compress(payload, 1)
+
+
+def decode_snapshot(blob: bytes, max_size: int = MAX_SNAPSHOT_BYTES) -> dict:
+    """
+    Deserialize a blob produced by encode_snapshot, refusing payloads that decompress beyond max_size bytes.
+    """
+    if blob[:4] != SNAPSHOT_MAGIC:
+        raise SnapshotError("Not a game snapshot")
+    version = int.from_bytes(blob[4:6], 'big')
+    if version != SNAPSHOT_VERSION:
+        raise SnapshotError(f"Unsupported snapshot version: {version}")
+    try:
+        decompressor = zlib.decompressobj()
+        payload = decompressor.decompress(blob[6:], max_size)
+        if decompressor.unconsumed_tail:
+            raise SnapshotError(f"Snapshot exceeds {max_size} bytes when decompressed")
+        if not decompressor.eof:
+            raise SnapshotError("Corrupt snapshot: truncated data")
+        return json.loads(payload)
+    except (zlib.error, ValueError) as e:
+        raise SnapshotError(f"Corrupt snapshot: {str(e)}")
@@ -0,0 +1,134 @@
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+STRUCTURED_OUTPUT = os.getenv('DM_STRUCTURED_OUTPUT', '0') == '1'
+
+STRUCTURED_OUTPUT_PROMPT = """
+**STRUCTURED OUTPUT MODE -- OVERRIDES THE TOOL RULES ABOVE:**
+No tools are available in this mode. Every prompt starts with a `Current scene state:` JSON block holding the players, their locations and the NPCs there; treat it as the source of truth.
+Reply with a single JSON object:
+*   `state_updates`: every state change you determined this turn, in the order they happen. Each entry has `entity` (`player`, `npc` or `location`), `name`, and `state`: a JSON-encoded object with the changed fields, following the player, NPC and location structures shown above. A new entity is created by its first update, so give it complete data.
+*   `narrative`: the text the players read, following the rules above (including asking for dice rolls).
+"""
+
+ENTITY_KINDS = ['player', 'npc', 'location']
+
+
+def response_schema():
+    """
+    Build the response schema for structured DM turns. State updates come first so they
+    can be applied while the narrative is still streaming.
+    """
+    from google.genai import types
+    update = types.Schema(
+        type='OBJECT',
+        properties={
+            'entity': types.Schema(type='STRING', enum=ENTITY_KINDS),
+            'name': types.Schema(type='STRING'),
+            'state': types.Schema(type='STRING', description='JSON object with the changed fields.'),
+        },
+        required=['entity', 'name', 'state'],
+        property_ordering=['entity', 'name', 'state'],
+    )
+    return types.Schema(
+        type='OBJECT',
+        properties={
+            'state_updates': types.Schema(type='ARRAY', items=update),
+            'narrative': types.Schema(type='STRING'),
+        },
+        required=['state_updates', 'narrative'],
+        property_ordering=['state_updates', 'narrative'],
+    )
+
+
+class StructuredResponseParser:
+    """
+    Incremental parser for a streamed structured response. feed() returns each
+    element of the top-level state_updates array as soon as it is complete, so
+    state can be applied before the narrative has finished streaming.
+    """
+    def __init__(self):
+        self.text = ''
+        self.position = 0
+        self.stack = []
+        self.in_string = False
+        self.escape = False
+        self.item_start = None
+        self.complete = False
+
+    def feed(self, chunk: str) -> list:
+        self.text += chunk
+        items = []
+        text = self.text
+        for index in range(self.position, len(text)):
+            char = text[index]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == '\\':
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+                continue
+            if char == '"':
+                self.in_string = True
+            elif char in '{[':
+                self.stack.append(char)
+                if self.stack == ['{', '[', '{']:
+                    self.item_start = index
+            elif char in '}]':
+                if self.stack == ['{', '[', '{'] and self.item_start is not None:
+                    items.append(json.loads(text[self.item_start:index + 1]))
+                    self.item_start = None
+                if self.stack:
+                    self.stack.pop()
+                if not self.stack:
+                    self.complete = True
+        self.position = len(text)
+        return items
+
+    def result(self) -> dict:
+        return json.loads(self.text)
+
+
+def scene_context(game_state) -> str:
+    """
+    Compact JSON of the players, their locations and the NPCs there, sent with each structured turn.
+    """
+    players = {name: player.to_dict() for name, player in game_state.players.items()}
+    location_names = {player['location'] for player in players.values() if player['location']}
+    if not location_names and game_state.current_location:
+        location_names = {game_state.current_location}
+    locations = {name: game_state.locations[name].to_dict() for name in location_names if name in game_state.locations}
+    npcs = {name: npc.to_dict() for name, npc in game_state.npcs.items() if npc.location in location_names or npc.location is None}
+    return json.dumps({'players': players, 'locations': locations, 'npcs': npcs}, separators=(',', ':'))
+
+
+def apply_state_update(game_state, update: dict) -> bool:
+    """
+    Apply one state_updates entry through the regular GameState methods, creating the entity if needed.
+    """
+    try:
+        entity, name = update['entity'], update['name']
+        state = json.loads(update['state']) if isinstance(update['state'], str) else update['state']
+        logger.info(f"Applying structured {entity} update: {name}")
+        if entity == 'player':
+            if name not in game_state.players:
+                game_state.add_player(name)
+            return game_state.update_player_state(name, state)
+        if entity == 'npc':
+            if name not in game_state.npcs:
+                game_state.add_npc(name)
+            return game_state.update_npc_state(name, state)
+        if entity == 'location':
+            if name not in game_state.locations:
+                game_state.add_location(name, state.get('description', ''))
+            return game_state.update_location_state(name, state)
+        logger.warning(f"Unknown entity kind in structured update: {entity}")
+        return False
+    except Exception as e:
+        logger.error(f"Error applying structured update {update}: {str(e)}", exc_info=True)
+        return False
@@ -0,0 +1,63 @@
+import inspect
+import logging
+from game_state import GameState
+
+logger = logging.getLogger(__name__)
+
+DM_TOOL_NAMES = ['add_player', 'add_location', 'add_npc',
+                 'update_player_state', 'update_npc_state', 'update_location_state',
+                 'get_player_state', 'get_location_state', 'get_npc_state',
+                 'get_all_players', 'get_all_npcs', 'get_all_locations', 'get_history',
+                 'search_history', 'find_path', 'get_nearby_locations']
+
+_SCHEMA_TYPES = {
+    str: 'STRING',
+    int: 'INTEGER',
+    float: 'NUMBER',
+    bool: 'BOOLEAN',
+    dict: 'OBJECT',
+    list: 'ARRAY',
+}
+
+
+def build_function_declaration(function) -> dict:
+    """
+    Build a function declaration dict for an unbound GameState method from its signature and docstring.
+    """
+    properties = {}
+    required = []
+    for name, param in inspect.signature(function).parameters.items():
+        if name == 'self':
+            continue
+        if param.annotation not in _SCHEMA_TYPES:
+            raise TypeError(f"Unsupported annotation for {function.__name__}.{name}: {param.annotation}")
+        properties[name] = {'type': _SCHEMA_TYPES[param.annotation]}
+        if param.default is inspect.Parameter.empty:
+            required.append(name)
+    declaration = {'name': function.__name__}
+    if function.__doc__:
+        declaration['description'] = inspect.cleandoc(function.__doc__)
+    if properties:
+        declaration['parameters'] = {'type': 'OBJECT', 'properties': properties, 'required': required}
+    return declaration
+
+
+# Built once at import time; every game shares these declarations.
+_TOOL_FUNCTIONS = {name: getattr(GameState, name) for name in DM_TOOL_NAMES}
+TOOL_DECLARATIONS = [{'function_declarations': [build_function_declaration(function)
+                                                for function in _TOOL_FUNCTIONS.values()]}]
+
+
+def dispatch_tool_call(game_state: GameState, name: str, args: dict) -> dict:
+    """
+    Run a model function call against a game state and wrap its result as a function response.
+    """
+    try:
+        logger.info(f"Dispatching tool call: {name}")
+        if name not in _TOOL_FUNCTIONS:
+            logger.warning(f"Unknown tool requested: {name}")
+            return {'error': f"Unknown function {name}"}
+        return {'result': _TOOL_FUNCTIONS[name](game_state, **(args or {}))}
+    except Exception as e:
+        logger.error(f"Error dispatching tool call {name}: {str(e)}", exc_info=True)
+        return {'error': str(e)}
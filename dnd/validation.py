@@ -0,0 +1,140 @@
+import copy
+from data.player import Player
+from data.npc import Npc
+from data.location import Location
+
+ITEM_DEFAULTS = {
+    'name': '',
+    'description': '',
+    'weight': 0.0,
+    'value': 0.0,
+    'health': 0,
+}
+
+
+def _kind(value) -> str:
+    if value is None:
+        return 'optional_str'
+    return type(value).__name__
+
+
+class Validator:
+    """
+    Validator for one entity schema, compiled once from the entity's default values.
+    validate() coerces what it safely can, fills defaults for missing fields of nested
+    items and NPCs, and drops what it can't fix, reporting a precise error for each.
+    """
+    def __init__(self, entity: str, defaults: dict, nested: dict = None):
+        self.entity = entity
+        self.defaults = defaults
+        self.nested = nested or {}
+        self.kinds = {field: _kind(value) for field, value in defaults.items()}
+
+    def validate(self, state, path: str = '', fill_defaults: bool = False):
+        """
+        Return (clean_state, errors). With fill_defaults, missing fields take their default value.
+        """
+        if not isinstance(state, dict):
+            return None, [f"{path or self.entity}: expected an object, got {type(state).__name__}"]
+        clean = copy.deepcopy(self.defaults) if fill_defaults else {}
+        errors = []
+        for field, value in state.items():
+            field_path = f"{path}.{field}" if path else field
+            if field not in self.kinds:
+                errors.append(f"{field_path}: unknown {self.entity} field, ignored")
+                continue
+            if field in self.nested:
+                value, field_errors = self._validate_list(self.nested[field], value, field_path)
+                errors.extend(field_errors)
+            else:
+                ok, value = _coerce(self.kinds[field], value)
+                if not ok:
+                    errors.append(f"{field_path}: expected {_describe(self.kinds[field])}, got {value!r}; kept previous value")
+                    continue
+            clean[field] = value
+        return clean, errors
+
+    def _validate_list(self, validator, value, path):
+        if isinstance(value, (dict, str)):
+            value = [value]
+        if not isinstance(value, list):
+            return [], [f"{path}: expected a list, got {type(value).__name__}; cleared"]
+        items = []
+        errors = []
+        for index, item in enumerate(value):
+            if isinstance(item, str):
+                # A bare name is accepted as an entity with default fields.
+                item = {'name': item}
+            clean, item_errors = validator.validate(item, f"{path}[{index}]", fill_defaults=True)
+            errors.extend(item_errors)
+            if clean is not None:
+                items.append(clean)
+        return items, errors
+
+
+def _coerce(kind: str, value):
+    if kind == 'int':
+        if isinstance(value, bool):
+            return False, value
+        if isinstance(value, int):
+            return True, value
+        if isinstance(value, float) and value.is_integer():
+            return True, int(value)
+        if isinstance(value, str):
+            try:
+                return True, int(value.strip())
+            except ValueError:
+                return False, value
+        return False, value
+    if kind == 'float':
+        if isinstance(value, bool):
+            return False, value
+        if isinstance(value, (int, float)):
+            return True, float(value)
+        if isinstance(value, str):
+            try:
+                return True, float(value.strip())
+            except ValueError:
+                return False, value
+        return False, value
+    if kind == 'bool':
+        if isinstance(value, bool):
+            return True, value
+        if isinstance(value, str) and value.lower() in ('true', 'false'):
+            return True, value.lower() == 'true'
+        return False, value
+    if kind == 'str':
+        if isinstance(value, str):
+            return True, value
+        if isinstance(value, (int, float)):
+            return True, str(value)
+        return False, value
+    if kind == 'optional_str':
+        if value is None or isinstance(value, str):
+            return True, value
+        return False, value
+    if kind == 'list':
+        if isinstance(value, list):
+            return True, [str(item) for item in value]
+        if isinstance(value, str):
+            return True, [value]
+        return False, value
+    return True, value
+
+
+def _describe(kind: str) -> str:
+    return {
+        'int': 'an integer',
+        'float': 'a number',
+        'bool': 'true or false',
+        'str': 'a string',
+        'optional_str': 'a string or null',
+        'list': 'a list of strings',
+    }.get(kind, kind)
+
+
+ITEM_VALIDATOR = Validator('item', ITEM_DEFAULTS)
+NPC_VALIDATOR = Validator('npc', Npc('').to_dict(), {'inventory': ITEM_VALIDATOR})
+PLAYER_VALIDATOR = Validator('player', Player('').to_dict(), {'inventory': ITEM_VALIDATOR})
+LOCATION_VALIDATOR = Validator('location', Location('', '').to_dict(),
+                               {'items': ITEM_VALIDATOR, 'npcs': NPC_VALIDATOR})
@@ -9,6 +9,7 @@ import * as api from './services/api';
 import { withErrorLogging } from './services/logger';
 
 // Wrap API calls with error logging
+const createGame = withErrorLogging(api.createGame, { operation: 'createGame' });
 const getGameHistory = withErrorLogging(api.getGameHistory, { operation: 'getGameHistory' });
 const getPlayerState = withErrorLogging(api.getPlayerState, { operation: 'getPlayerState' });
 const sendPlayerAction = withErrorLogging(api.sendPlayerAction, { operation: 'sendPlayerAction' });
@@ -89,6 +90,7 @@ export default function ChatUI() {
     setIsJoiningGame(true);
     setModelResponse('Wait while the DM prepares the game!');
     try {
+      await createGame(gameId);
       const historyResponse = await getGameHistory(gameId);
       setModelResponse(historyResponse.history.join('\n') || 'No response from DM.');
       await updatePlayerState();
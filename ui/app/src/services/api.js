@@ -10,6 +10,16 @@ export async function addPlayer(gameId, playerName) {
   return response.json();
 }
 
+export async function createGame(gameId) {
+  const response = await fetch(`${API_URL}/create_game/`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ game_id: gameId }),
+  });
+  if (!response.ok) throw new Error('Failed to create game');
+  return response.json();
+}
+
 export async function sendPlayerAction(gameId, playerName, action) {
   const response = await fetch(`${API_URL}/player_action/`, {
     method: 'POST',